@@ -1,8 +1,25 @@
 import re
 import ast
+import copy
 import json
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
+# orjson (C extension) is optional; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# fastjsonschema compiles the schema to plain Python; jsonschema is the fallback
+try:
+    import fastjsonschema
+    from fastjsonschema import JsonSchemaException as ValidationError
+except ImportError:
+    fastjsonschema = None
+    from jsonschema.validators import validator_for
+    from jsonschema.exceptions import ValidationError
+
 EXPECTED_KEYS = {
     "summary",
     "draft_note",
@@ -14,15 +31,60 @@ EXPECTED_KEYS = {
     "risk_flags",
 }
 
+# Output JSON must have these; used to pick the answer over an echoed prompt skeleton
+CORE_KEYS = ("summary", "draft_note", "missing_info", "followup_questions", "safety", "provenance")
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?")
+
+@lru_cache(maxsize=8)
+def _compile_validator(schema_json: str):
+    schema = json.loads(schema_json)
+    if fastjsonschema is not None:
+        # Same semantics as jsonschema.validate: don't inject defaults, don't check formats
+        return fastjsonschema.compile(schema, use_default=False, use_formats=False)
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema).validate
+
+def get_validator(schema: Dict[str, Any]):
+    """
+    Returns a compiled validate(instance) callable for schema, raising ValidationError
+    (with .message) on invalid instances. Cached by schema content.
+    """
+    # Keyed by content, not id(): callers reload the schema dict on every Streamlit rerun
+    return _compile_validator(json.dumps(schema, sort_keys=True))
+
+def loads_json(data):
+    """Parse JSON from bytes or str; bytes go straight to the parser (no separate decode)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_json_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (non-ASCII kept as-is), optionally with 2-space indent."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+def dumps_json(obj: Any, indent: bool = False) -> str:
+    """Same as dumps_json_bytes, decoded to str."""
+    if orjson is None:
+        return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None)
+    return dumps_json_bytes(obj, indent).decode("utf-8")
+
 def _strip_code_fences(text: str) -> str:
     if not text:
         return ""
     # remove ```json / ``` fences, keep inner content
-    text = re.sub(r"```(?:json|JSON)?", "", text)
-    text = text.replace("```", "")
-    return text.strip()
+    return _FENCE_RE.sub("", text).strip()
 
-def _scan_top_level_json_object_spans(text: str) -> List[Tuple[int, int]]:
+# One match per JSON string literal (escape-aware; an unterminated string runs to the end)
+# or per brace, so the scan loop below only visits "interesting" positions.
+_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?:"|\\?\Z)|[{}]', re.DOTALL)
+
+@lru_cache(maxsize=32)
+def _scan_top_level_json_object_spans(text: str) -> Tuple[Tuple[int, int], ...]:
     """
     Returns spans (start, end_exclusive) for every top-level {...} JSON-like object.
     Uses brace balancing with string/escape awareness.
@@ -31,36 +93,64 @@ def _scan_top_level_json_object_spans(text: str) -> List[Tuple[int, int]]:
     depth = 0
     start = None
 
-    in_str = False
-    esc = False
-
-    for i, ch in enumerate(text):
-        if in_str:
-            if esc:
-                esc = False
-            elif ch == "\\":
-                esc = True
-            elif ch == '"':
-                in_str = False
-            continue
-
-        # not in string
-        if ch == '"':
-            in_str = True
-            continue
-
+    for m in _TOKEN_RE.finditer(text):
+        ch = m.group()
         if ch == "{":
             if depth == 0:
-                start = i
+                start = m.start()
             depth += 1
         elif ch == "}":
             if depth > 0:
                 depth -= 1
                 if depth == 0 and start is not None:
-                    spans.append((start, i + 1))
+                    spans.append((start, m.end()))
                     start = None
 
-    return spans
+    return tuple(spans)
+
+class JsonObjectTracker:
+    """
+    Incremental version of the span scanner for streamed model output.
+    feed() returns True once a top-level {...} object containing `required_key`
+    has been closed, i.e. the model has finished writing the Output JSON.
+    """
+
+    def __init__(self, required_key: str = "provenance"):
+        self._needle = '"' + required_key + '"'
+        self._chunks: List[str] = []
+        self._pos = 0
+        self._depth = 0
+        self._start: Optional[int] = None
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, chunk: str) -> bool:
+        self._chunks.append(chunk)
+        done = False
+        for i, ch in enumerate(chunk, start=self._pos):
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+
+            if ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    text = "".join(self._chunks)
+                    done = done or self._needle in text[self._start:i + 1]
+                    self._start = None
+        self._pos += len(chunk)
+        return done
 
 def _parse_candidate(candidate: str) -> Optional[Dict[str, Any]]:
     """
@@ -89,6 +179,10 @@ def _parse_candidate(candidate: str) -> Optional[Dict[str, Any]]:
     except Exception:
         return None
 
+def _score(obj: Dict[str, Any]) -> int:
+    """Number of expected Output JSON keys present in obj."""
+    return sum(1 for k in EXPECTED_KEYS if k in obj)
+
 def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
     """
     Extract the *best* JSON object from model output.
@@ -96,10 +190,16 @@ def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
     - Finds ALL top-level {...} objects
     - Prefers the LAST object that matches expected output keys
       (important when prompt contains an earlier JSON skeleton)
+    Results are memoized per text; callers get their own copy and may mutate it.
     """
     if not text:
         return None
 
+    obj = _extract_json_object_cached(text)
+    return copy.deepcopy(obj) if obj is not None else None
+
+@lru_cache(maxsize=64)
+def _extract_json_object_cached(text: str) -> Optional[Dict[str, Any]]:
     text = _strip_code_fences(text)
 
     spans = _scan_top_level_json_object_spans(text)
@@ -118,12 +218,10 @@ def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
 
     # Prefer the last object that looks like Output JSON
     for obj in reversed(parsed):
-        keys = set(obj.keys())
         # must have core keys; allow some missing but prefer more matches
-        core = {"summary", "draft_note", "missing_info", "followup_questions", "safety", "provenance"}
-        if core.issubset(keys):
+        if all(k in obj for k in CORE_KEYS):
             return obj
 
     # Otherwise: pick the object with the most expected keys
-    best = max(parsed, key=lambda o: len(set(o.keys()) & EXPECTED_KEYS))
+    best = max(parsed, key=_score)
     return best
\ No newline at end of file
@@ -1,11 +1,55 @@
-import json
+import re
+import sys
 import uuid
+import shutil
+import pandas as pd
 import streamlit as st
 from pathlib import Path
 from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = Path(__file__).resolve().parents[2]  # корень проекта
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from app.core.json_utils import dumps_json_bytes
 
 # ---------- helpers ----------
 UPLOAD_DIR = Path("uploads")
+UPLOAD_CHUNK = 1 << 20  # 1 MiB
+_COMMA_RE = re.compile(r"\s*,\s*")
+
+# Timeline / temperature option lists (built once, not per rerun)
+SYMPTOM_OPTIONS = (
+    "cough",
+    "runny_nose",
+    "sore_throat",
+    "fever",
+    "abdominal_pain",
+    "vomiting",
+    "diarrhea",
+    "rash",
+    "chest_pain",
+    "shortness_of_breath",
+    "fatigue",
+    "dizziness",
+    "other",
+)
+CHANGE_OPTIONS = ("appeared", "worsened", "improved", "resolved")
+SEVERITY_OPTIONS = ("mild", "moderate", "severe", "unknown")
+TIME_OF_DAY_OPTIONS = ("morning", "day", "evening", "night")
+ANTIPYRETIC_OPTIONS = ("yes", "no", "unknown")
+
+# Explicit dtypes so the empty data_editor tables get the right column kinds
+TIMELINE_DTYPES = {
+    "date": "object",
+    "symptom_type": "object",
+    "change": "object",
+    "character": "object",
+    "severity": "object",
+    "notes": "object",
+}
+TEMP_DTYPES = {"date": "object", "time_of_day": "object", "value_c": "float64", "antipyretic_taken": "object"}
 
 
 def now_iso():
@@ -13,11 +57,113 @@ def now_iso():
 
 def ensure_session_defaults():
     st.session_state.setdefault("timeline_events", [])
+    if "timeline_df" not in st.session_state:
+        st.session_state["timeline_df"] = empty_frame(TIMELINE_DTYPES)
     st.session_state.setdefault("temp_rows", [])
+    if "temp_df" not in st.session_state:
+        st.session_state["temp_df"] = empty_frame(TEMP_DTYPES)
     st.session_state.setdefault("attachments", [])
+    st.session_state.setdefault("saved_uploads", {})
+    st.session_state.setdefault("upload_futures", [])
+
+def empty_frame(dtypes: dict) -> pd.DataFrame:
+    return pd.DataFrame({col: pd.Series(dtype=dt) for col, dt in dtypes.items()})
+
+def _cell(v):
+    """data_editor cell -> JSON value (empty / NaN -> None)."""
+    if v is None or v == "" or pd.isna(v):
+        return None
+    return v
+
+def timeline_records(df: pd.DataFrame, default_date: date) -> list:
+    """Timeline data_editor rows -> Intake JSON events (dates as ISO strings)."""
+    events = []
+    for row in df.to_dict("records"):
+        d = _cell(row.get("date"))
+        events.append(
+            {
+                "date": pd.Timestamp(d).date().isoformat() if d is not None else str(default_date),
+                "symptom_type": _cell(row.get("symptom_type")) or "other",
+                "change": _cell(row.get("change")) or "appeared",
+                "character": _cell(row.get("character")),
+                "severity": _cell(row.get("severity")) or "unknown",
+                "notes": _cell(row.get("notes")),
+            }
+        )
+    return events
+
+def temp_records(df: pd.DataFrame, default_date: date) -> list:
+    """Temperature data_editor rows -> Intake JSON graph points (rows without a value are skipped)."""
+    rows = []
+    for row in df.to_dict("records"):
+        value = _cell(row.get("value_c"))
+        if value is None:
+            continue
+        d = _cell(row.get("date"))
+        rows.append(
+            {
+                "date": pd.Timestamp(d).date().isoformat() if d is not None else str(default_date),
+                "time_of_day": _cell(row.get("time_of_day")) or "morning",
+                "value_c": float(value),
+                "antipyretic_taken": _cell(row.get("antipyretic_taken")) or "unknown",
+            }
+        )
+    return rows
+
+def timeline_frame(rows: list) -> pd.DataFrame:
+    """Intake JSON events -> timeline data_editor rows (inverse of timeline_records)."""
+    if not rows:
+        return empty_frame(TIMELINE_DTYPES)
+    df = pd.DataFrame(rows, columns=list(TIMELINE_DTYPES))
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+def temp_frame(rows: list) -> pd.DataFrame:
+    """Intake JSON graph points -> temperature data_editor rows (inverse of temp_records)."""
+    if not rows:
+        return empty_frame(TEMP_DTYPES)
+    df = pd.DataFrame(rows, columns=list(TEMP_DTYPES))
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+@st.cache_resource
+def upload_executor() -> ThreadPoolExecutor:
+    """Shared by all sessions, so uploads don't each spawn a pool."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+
+def _write_upload(uploaded_file, path: Path) -> None:
+    # Copy in fixed-size chunks: peak memory is one chunk, not a second copy of the file
+    uploaded_file.seek(0)
+    with open(path, "wb", buffering=UPLOAD_CHUNK) as f:
+        shutil.copyfileobj(uploaded_file, f, length=UPLOAD_CHUNK)
+
+def wait_for_uploads() -> bool:
+    """
+    Block until pending background writes finish. A failed write is reported and forgotten
+    (so the next rerun writes that upload again); returns False if any write failed.
+    """
+    pending = st.session_state["upload_futures"]
+    ok = True
+    while pending:
+        file_id, name, fut = pending.pop()
+        try:
+            fut.result()
+        except Exception as e:
+            ok = False
+            st.session_state["saved_uploads"].pop(file_id, None)
+            st.error(f"Could not save upload {name}: {e}. Click \"Build intake JSON\" again to retry.")
+    return ok
 
 def save_upload(uploaded_file, prefix: str) -> dict:
-    """Save uploaded file to uploads/ and return attachment object for Intake JSON."""
+    """
+    Save uploaded file to uploads/ (in a background thread) and return attachment object
+    for Intake JSON. The same upload is written only once, not on every rerun.
+    """
+    saved = st.session_state["saved_uploads"]
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id in saved:
+        return dict(saved[file_id])
+
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     stamp = datetime.now().strftime("%Y%m%d")
     folder = UPLOAD_DIR / stamp
@@ -27,16 +173,27 @@ def save_upload(uploaded_file, prefix: str) -> dict:
     fname = f"{prefix}_{uuid.uuid4().hex}_{safe_name}"
     path = folder / fname
 
-    with open(path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    st.session_state["upload_futures"].append(
+        (file_id, safe_name, upload_executor().submit(_write_upload, uploaded_file, path))
+    )
 
-    return {
+    att = {
         "type": prefix,  # must match schema enum ("audio_cough" / "photo_rash" / "other")
         "label": None,
         "file_name": safe_name,
         "mime_type": uploaded_file.type,
         "uri": str(path).replace("\\", "/"),
     }
+    if file_id is not None:
+        saved[file_id] = att
+    return dict(att)
+
+def split_csv(text: str) -> list:
+    """'a, b,,c ' -> ['a', 'b', 'c'] (whitespace around commas and empty items dropped)."""
+    text = text.strip()
+    if not text:
+        return []
+    return [x for x in _COMMA_RE.split(text) if x]
 
 def add_missing(missing: list, msg: str):
     if msg not in missing:
@@ -120,58 +277,31 @@ st.divider()
 st.subheader("3) Timeline by dates / Chronologia po datach")
 st.write("Dodaj zdarzenia: **data + objaw + co się zmieniło**. Minimum 1 wpis.")
 
-if st.button("➕ Add timeline event"):
-    st.session_state["timeline_events"].append(
-        {
-            "date": str(started),
-            "symptom_type": "other",
-            "change": "appeared",
-            "character": None,
-            "severity": "unknown",
-            "notes": None,
-        }
+# Fragment: editing the table reruns only this function, not the whole page
+@st.fragment
+def timeline_editor(default_date: date):
+    # One data_editor for all events instead of 6 widgets per event.
+    # The editor input stays fixed (edits live in the widget state), so it is not overwritten here,
+    # except on mount: widget state is dropped on page switches, so re-seed from the saved events.
+    if "timeline_editor" not in st.session_state:
+        st.session_state["timeline_df"] = timeline_frame(st.session_state["timeline_events"])
+    edited_tl = st.data_editor(
+        st.session_state["timeline_df"],
+        key="timeline_editor",
+        num_rows="dynamic",
+        width="stretch",
+        column_config={
+            "date": st.column_config.DateColumn("Date", required=True, default=default_date),
+            "symptom_type": st.column_config.SelectboxColumn("Symptom", options=SYMPTOM_OPTIONS, required=True, default="other"),
+            "change": st.column_config.SelectboxColumn("Change", options=CHANGE_OPTIONS, required=True, default="appeared"),
+            "character": st.column_config.TextColumn("Character (optional)"),
+            "severity": st.column_config.SelectboxColumn("Severity", options=SEVERITY_OPTIONS, required=True, default="unknown"),
+            "notes": st.column_config.TextColumn("Notes (optional)"),
+        },
     )
+    st.session_state["timeline_events"] = timeline_records(edited_tl, default_date=default_date)
 
-symptom_options = [
-    "cough",
-    "runny_nose",
-    "sore_throat",
-    "fever",
-    "abdominal_pain",
-    "vomiting",
-    "diarrhea",
-    "rash",
-    "chest_pain",
-    "shortness_of_breath",
-    "fatigue",
-    "dizziness",
-    "other",
-]
-
-for i, ev in enumerate(st.session_state["timeline_events"]):
-    with st.container(border=True):
-        c1, c2, c3 = st.columns(3)
-        ev["date"] = str(c1.date_input(f"Date #{i+1}", value=date.fromisoformat(ev["date"]), key=f"tl_date_{i}"))
-        ev["symptom_type"] = c2.selectbox(
-            f"Symptom #{i+1}", symptom_options, index=symptom_options.index(ev["symptom_type"]), key=f"tl_sym_{i}"
-        )
-        ev["change"] = c3.selectbox(
-            f"Change #{i+1}", ["appeared", "worsened", "improved", "resolved"],
-            index=["appeared","worsened","improved","resolved"].index(ev["change"]),
-            key=f"tl_chg_{i}"
-        )
-        c4, c5 = st.columns(2)
-        ev["severity"] = c4.selectbox(
-            f"Severity #{i+1}", ["mild", "moderate", "severe", "unknown"],
-            index=["mild","moderate","severe","unknown"].index(ev["severity"] or "unknown"),
-            key=f"tl_sev_{i}"
-        )
-        ev["character"] = c5.text_input(f"Character (optional) #{i+1}", value=ev.get("character") or "", key=f"tl_char_{i}") or None
-        ev["notes"] = st.text_area(f"Notes (optional) #{i+1}", value=ev.get("notes") or "", key=f"tl_notes_{i}") or None
-
-        if st.button("🗑 Remove this event", key=f"tl_del_{i}"):
-            st.session_state["timeline_events"].pop(i)
-            st.rerun()
+timeline_editor(started)
 
 st.divider()
 
@@ -179,31 +309,31 @@ st.divider()
 st.subheader("4) Temperature graph / Wykres temperatury")
 show_temp = (chief == "fever") or st.toggle("Add temperature section (optional)", value=(chief == "fever"))
 
+@st.fragment
+def temperature_editor(default_date: date):
+    # Widget state is dropped while the section is hidden; re-seed from the saved rows on mount
+    # (only then: replacing the input while mounted would reset the user's edits)
+    if "temp_editor" not in st.session_state:
+        st.session_state["temp_df"] = temp_frame(st.session_state["temp_rows"])
+    edited_temp = st.data_editor(
+        st.session_state["temp_df"],
+        key="temp_editor",
+        num_rows="dynamic",
+        width="stretch",
+        column_config={
+            "date": st.column_config.DateColumn("Date", required=True, default=default_date),
+            "time_of_day": st.column_config.SelectboxColumn("Time", options=TIME_OF_DAY_OPTIONS, required=True, default="morning"),
+            "value_c": st.column_config.NumberColumn(
+                "Value °C", min_value=30.0, max_value=45.0, step=0.1, required=True, default=37.0
+            ),
+            "antipyretic_taken": st.column_config.SelectboxColumn("Antipyretic?", options=ANTIPYRETIC_OPTIONS, required=True, default="unknown"),
+        },
+    )
+    st.session_state["temp_rows"] = temp_records(edited_temp, default_date=default_date)
+
 if show_temp:
     st.write("Wpisz pomiary: data + pora dnia + wartość. (Rano/Dzień/Wieczór/Noc)")
-    if st.button("➕ Add temperature row"):
-        st.session_state["temp_rows"].append(
-            {"date": str(today), "time_of_day": "morning", "value_c": 37.0, "antipyretic_taken": "unknown"}
-        )
-
-    for i, tr in enumerate(st.session_state["temp_rows"]):
-        with st.container(border=True):
-            a, b, c, d = st.columns(4)
-            tr["date"] = str(a.date_input(f"Date T#{i+1}", value=date.fromisoformat(tr["date"]), key=f"t_date_{i}"))
-            tr["time_of_day"] = b.selectbox(
-                f"Time T#{i+1}", ["morning", "day", "evening", "night"],
-                index=["morning","day","evening","night"].index(tr["time_of_day"]),
-                key=f"t_time_{i}"
-            )
-            tr["value_c"] = float(c.number_input(f"Value °C T#{i+1}", min_value=30.0, max_value=45.0, value=float(tr["value_c"]), step=0.1, key=f"t_val_{i}"))
-            tr["antipyretic_taken"] = d.selectbox(
-                f"Antipyretic? T#{i+1}", ["yes", "no", "unknown"],
-                index=["yes","no","unknown"].index(tr["antipyretic_taken"]),
-                key=f"t_ant_{i}"
-            )
-            if st.button("🗑 Remove temp row", key=f"t_del_{i}"):
-                st.session_state["temp_rows"].pop(i)
-                st.rerun()
+    temperature_editor(today)
 
 st.divider()
 
@@ -294,9 +424,9 @@ allergies = st.text_area("Allergies (comma-separated) / Alergie", value="")
 meds = st.text_area("Current meds/supplements (comma-separated)", value="")
 
 history = {
-    "chronic_conditions": [x.strip() for x in chronic.split(",") if x.strip()],
-    "allergies": [x.strip() for x in allergies.split(",") if x.strip()],
-    "current_meds_supplements": [x.strip() for x in meds.split(",") if x.strip()],
+    "chronic_conditions": split_csv(chronic),
+    "allergies": split_csv(allergies),
+    "current_meds_supplements": split_csv(meds),
 }
 
 st.divider()
@@ -385,11 +515,19 @@ if missing:
     st.warning("Missing / Braki:\n- " + "\n- ".join(missing))
 
 st.subheader("Resulting Intake JSON")
-st.code(json.dumps(intake, indent=2, ensure_ascii=False), language="json")
-
-st.download_button(
-    "Download intake.json",
-    data=json.dumps(intake, indent=2, ensure_ascii=False),
-    file_name="intake.json",
-    mime="application/json",
-)
\ No newline at end of file
+# Serialize only on request, not on every widget interaction
+if st.button("Build intake JSON") and wait_for_uploads():
+    st.session_state["intake_bytes"] = dumps_json_bytes(intake, indent=True)
+
+# Kept in session_state so the download click's rerun doesn't hide the preview/button
+intake_bytes = st.session_state.get("intake_bytes")
+if intake_bytes is not None:
+    st.caption("Built from the form as of the last click; build again after changes.")
+    st.code(intake_bytes.decode("utf-8"), language="json")
+
+    st.download_button(
+        "Download intake.json",
+        data=intake_bytes,
+        file_name="intake.json",
+        mime="application/json",
+    )
\ No newline at end of file
@@ -1,20 +1,22 @@
 import sys
-import json
+import hashlib
 import pandas as pd
 import streamlit as st
 from pathlib import Path
-from jsonschema import validate
-from jsonschema.exceptions import ValidationError
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT = Path(__file__).resolve().parents[2]  # корень проекта
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from app.core.generator import generate_output
+from app.core.json_utils import ValidationError, dumps_json, dumps_json_bytes, get_validator, loads_json
 
 BASE = Path(__file__).resolve().parents[2]
 INTAKE_SCHEMA_PATH = BASE / "schemas" / "intake.schema.json"
 OUTPUT_SCHEMA_PATH = BASE / "schemas" / "output.schema.json"
+# Ordered categorical: sorts by int8 codes; unknown values become NaN and sort last
+TIME_OF_DAY_DTYPE = pd.CategoricalDtype(["morning", "day", "evening", "night"], ordered=True)
 
 def safe_get(d, *keys, default=None):
     cur = d
@@ -24,34 +26,83 @@ def safe_get(d, *keys, default=None):
         cur = cur[k]
     return cur
 
-def load_json_schema(path: Path):
-    return json.loads(path.read_text(encoding="utf-8"))
+@st.cache_resource(show_spinner=False)
+def load_json_schema(path: str) -> dict:
+    """Parsed once per process and shared across reruns/sessions; treat as read-only."""
+    return loads_json(Path(path).read_bytes())
+
+@st.cache_resource(show_spinner=False)
+def intake_validator():
+    return get_validator(load_json_schema(str(INTAKE_SCHEMA_PATH)))
+
+# Bounded: entries hold patient data and are shared across sessions, so they must not live forever
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def load_intake(digest: str, _raw: bytes):
+    """
+    Parse + validate an uploaded intake, cached by content digest (_raw is not hashed),
+    so reruns with the same upload skip both. Returns (intake, error_message_or_None).
+    """
+    intake = loads_json(_raw)
+    try:
+        intake_validator()(intake)
+        return intake, None
+    except ValidationError as e:
+        return intake, e.message
+
+# Frames derive from the uploaded intake, so they are cached on its content digest
+# (underscore args are not hashed) and bounded like load_intake.
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def timeline_frame(intake_digest: str, _events: list) -> pd.DataFrame:
+    df_tl = pd.DataFrame(_events)
+    if "date" in df_tl.columns:
+        df_tl["date"] = pd.to_datetime(df_tl["date"], errors="coerce")
+        df_tl = df_tl.sort_values("date")
+        df_tl["date"] = df_tl["date"].dt.date.astype(str)
+    return df_tl
 
-def file_exists(uri: str) -> bool:
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def temperature_frame(intake_digest: str, _graph: list) -> pd.DataFrame:
+    df_temp = pd.DataFrame(_graph)
+    df_temp["date"] = pd.to_datetime(df_temp["date"], errors="coerce")
+    df_temp["label"] = df_temp["date"].dt.strftime("%Y-%m-%d").str.cat(df_temp["time_of_day"], sep=" ")
+    df_temp["time_of_day"] = df_temp["time_of_day"].astype(TIME_OF_DAY_DTYPE)
+    return df_temp.sort_values(["date", "time_of_day"])
+
+def file_stat(uri: str):
+    """os.stat_result for uri, or None if missing/inaccessible (one syscall)."""
     try:
-        return Path(uri).exists()
+        return Path(uri).stat()
     except Exception:
-        return False
+        return None
+
+# Bounded: audio files are MBs each and the cache is shared by every session in the process
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def read_attachment_bytes(uri: str, mtime_ns: int) -> bytes:
+    # mtime_ns is only part of the cache key: a changed file is re-read
+    return Path(uri).read_bytes()
+
+@st.cache_resource
+def generation_executor() -> ThreadPoolExecutor:
+    """Shared worker for generate_output; one at a time, since sessions share one cached model."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
 
 st.title("Doctor Dashboard (MVP)")
 
-INTAKE_SCHEMA = load_json_schema(INTAKE_SCHEMA_PATH)
-OUTPUT_SCHEMA = load_json_schema(OUTPUT_SCHEMA_PATH)
+OUTPUT_SCHEMA = load_json_schema(str(OUTPUT_SCHEMA_PATH))
 
 uploaded = st.file_uploader("Upload intake.json", type=["json"])
 if not uploaded:
     st.info("Upload an intake.json (download one on the Patient Intake page).")
     st.stop()
 
-intake = json.loads(uploaded.read().decode("utf-8"))
+raw_intake = uploaded.getvalue()
+intake_digest = hashlib.blake2b(raw_intake, digest_size=16).hexdigest()
+intake, intake_error = load_intake(intake_digest, raw_intake)
 
-try:
-    validate(instance=intake, schema=INTAKE_SCHEMA)
+if intake_error is None:
     st.success("Intake JSON is valid.")
-except ValidationError as e:
-    st.error(f"Intake JSON is invalid: {e.message}")
-
-st.divider()
+else:
+    st.error(f"Intake JSON is invalid: {intake_error}")
 
 age = safe_get(intake, "patient", "age_years", default="unknown")
 sex = safe_get(intake, "patient", "sex", default="unknown")
@@ -60,15 +111,16 @@ started = safe_get(intake, "visit", "started_on_date", default="unknown")
 today = safe_get(intake, "visit", "today_date", default="unknown")
 free = safe_get(intake, "visit", "chief_complaint_free_text", default=None)
 
-c1, c2, c3 = st.columns(3)
-c1.metric("Age", age)
-c2.metric("Sex", sex)
-c3.metric("Chief complaint", chief)
-st.write(f"**Start:** {started}   |   **Today:** {today}")
-if free:
-    st.write(f"**Short note:** {free}")
+# One markdown block (dividers included) instead of columns/metrics/writes per rerun.
+note = f"\n\n**Short note:** {free}" if free else ""
+st.markdown(
+    f"""---
+**Age:** {age}   |   **Sex:** {sex}   |   **Chief complaint:** {chief}
 
-st.divider()
+**Start:** {started}   |   **Today:** {today}{note}
+
+---"""
+)
 
 risk_level = safe_get(intake, "risk_flags_rule_based", "risk_level", default="LOW")
 risk_flags = safe_get(intake, "risk_flags_rule_based", "flags", default=[])
@@ -85,12 +137,7 @@ st.divider()
 st.subheader("Timeline (by dates)")
 events = safe_get(intake, "timeline", "events", default=[])
 if events:
-    df_tl = pd.DataFrame(events).copy()
-    if "date" in df_tl.columns:
-        df_tl["date"] = pd.to_datetime(df_tl["date"], errors="coerce")
-        df_tl = df_tl.sort_values("date")
-        df_tl["date"] = df_tl["date"].dt.date.astype(str)
-    st.dataframe(df_tl, width="stretch")
+    st.dataframe(timeline_frame(intake_digest, events), width="stretch")
 else:
     st.info("No timeline events.")
 
@@ -99,12 +146,7 @@ st.divider()
 st.subheader("Temperature graph")
 temp_graph = safe_get(intake, "measurements", "temperature", "graph", default=[])
 if temp_graph:
-    df_temp = pd.DataFrame(temp_graph).copy()
-    df_temp["date"] = pd.to_datetime(df_temp["date"], errors="coerce")
-    order = {"morning": 0, "day": 1, "evening": 2, "night": 3}
-    df_temp["tod_order"] = df_temp["time_of_day"].map(order).fillna(99).astype(int)
-    df_temp = df_temp.sort_values(["date", "tod_order"])
-    df_temp["label"] = df_temp["date"].dt.strftime("%Y-%m-%d") + " " + df_temp["time_of_day"]
+    df_temp = temperature_frame(intake_digest, temp_graph)
 
     st.dataframe(df_temp[["label", "value_c", "antipyretic_taken"]], width="stretch")
     chart_df = df_temp.set_index("label")[["value_c"]]
@@ -125,15 +167,15 @@ else:
         label = a.get("label") or a.get("file_name") or a_type
 
         st.write(f"**{a_type}** — {label}")
-        if not uri or not file_exists(uri):
+        stat = file_stat(uri) if uri else None
+        if stat is None:
             st.warning("File not found (uri missing or path not accessible).")
             continue
 
-        p = Path(uri)
         if a_type == "audio_cough":
-            st.audio(p.read_bytes())
+            st.audio(read_attachment_bytes(uri, stat.st_mtime_ns))
         elif a_type == "photo_rash":
-            st.image(str(p), caption=label, width="stretch")
+            st.image(uri, caption=label, width="stretch")
         else:
             st.write(f"Stored at: {uri}")
 
@@ -143,27 +185,55 @@ st.subheader("Generate Output (MedGemma)")
 st.caption("Default=stub. For real model: set MODEL_PROVIDER=transformers + MODEL_ID in .env.")
 
 if st.button("Generate output.json"):
-    with st.spinner("Generating..."):
-        try:
-            out, raw = generate_output(
-                intake=intake,
-                output_schema=OUTPUT_SCHEMA,
-                risk_level=risk_level,
-                risk_flags=risk_flags,
-                prompts_dir=str(BASE / "prompts")
-            )
-            st.success("Generated output.json (schema-valid).")
-            st.code(json.dumps(out, indent=2, ensure_ascii=False), language="json")
-            st.download_button(
-                "Download output.json",
-                data=json.dumps(out, indent=2, ensure_ascii=False),
-                file_name="output.json",
-                mime="application/json",
-            )
-            with st.expander("Raw model text"):
-                st.text(raw)
-        except Exception as e:
-            st.error(str(e))
+    # Run off the script thread so the page stays usable during inference.
+    # Tagged with the intake digest so a result is only ever shown for the intake it came from.
+    st.session_state["gen_job"] = (
+        intake_digest,
+        generation_executor().submit(
+            generate_output,
+            intake=intake,
+            output_schema=OUTPUT_SCHEMA,
+            risk_level=risk_level,
+            risk_flags=risk_flags,
+            prompts_dir=str(BASE / "prompts"),
+        ),
+    )
+
+gen_future = None
+gen_job = st.session_state.get("gen_job")
+if gen_job is not None:
+    job_digest, gen_future = gen_job
+    if job_digest != intake_digest:
+        # A different intake was uploaded: never show (or offer to download) the old patient's output
+        gen_future.cancel()
+        del st.session_state["gen_job"]
+        gen_future = None
+
+if gen_future is not None and not gen_future.done():
+    @st.fragment(run_every=0.5)
+    def generation_status():
+        # Polls only this fragment; a full rerun renders the result once it is ready
+        if gen_future.done():
+            st.rerun()
+        st.info("Generating...")
+
+    generation_status()
+elif gen_future is not None:
+    try:
+        out, raw = gen_future.result()
+        st.success("Generated output.json (schema-valid).")
+        out_bytes = dumps_json_bytes(out, indent=True)
+        st.code(out_bytes.decode("utf-8"), language="json")
+        st.download_button(
+            "Download output.json",
+            data=out_bytes,
+            file_name="output.json",
+            mime="application/json",
+        )
+        with st.expander("Raw model text"):
+            st.text(raw)
+    except Exception as e:
+        st.error(str(e))
 
 with st.expander("Raw Intake JSON"):
-    st.code(json.dumps(intake, indent=2, ensure_ascii=False), language="json")
+    st.code(dumps_json(intake, indent=True), language="json")
@@ -4,12 +4,17 @@ from __future__ import annotations
 import os
 import sys
 import json
+import shutil
+import tempfile
 import inspect
 import argparse
 import traceback
 from pathlib import Path
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
-from dataclasses import dataclass, asdict
+from functools import lru_cache, partial
+from dataclasses import dataclass, fields
 from typing import Any, Dict, Optional, Tuple, Callable
 
 # Make repo root importable so `import app...` works when running `python scripts/run_demo.py`
@@ -17,21 +22,43 @@ REPO_ROOT = Path(__file__).resolve().parents[1]
 if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
+# Heavy/optional modules are imported by _load_deps() (after argument parsing, and
+# in each pool worker) so `--help` and early CLI errors don't pay for them.
+jsonschema: Any = None
+fastjsonschema: Any = None
+ValidationError: Any = None
+JsonSchemaException: Any = None
+loads_json: Callable[[Any], Any]
+dumps_json_bytes: Callable[..., bytes]
+get_validator: Callable[[Dict[str, Any]], Callable[[Any], Any]]
+
+def _load_deps() -> None:
+    global jsonschema, fastjsonschema, ValidationError, JsonSchemaException, loads_json, dumps_json_bytes, get_validator
+    if jsonschema is not None:
+        return
 
+    try:
+        import jsonschema as _jsonschema
+    except Exception:
+        print("ERROR: jsonschema is required. Install: pip install jsonschema", file=sys.stderr)
+        raise
+    jsonschema = _jsonschema
+    ValidationError = _jsonschema.ValidationError
 
-# Optional .env support (doesn't fail if not installed)
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except Exception:
-    pass
+    # Compiled validators are much faster on repeated runs; USE_JSONSCHEMA=1 keeps
+    # the plain jsonschema path (e.g. for CI bit-compat).
+    try:
+        import fastjsonschema as _fastjsonschema  # type: ignore
+        fastjsonschema = _fastjsonschema
+        JsonSchemaException = _fastjsonschema.JsonSchemaException
+    except Exception:
+        fastjsonschema = None
+        JsonSchemaException = ValidationError
 
-try:
-    import jsonschema
-    from jsonschema import ValidationError
-except Exception as e:
-    print("ERROR: jsonschema is required. Install: pip install jsonschema", file=sys.stderr)
-    raise
+    # orjson-backed (stdlib json fallback) bytes helpers shared with the app
+    # (and the app's cached fastjsonschema validator)
+    from app.core.json_utils import dumps_json_bytes as _dumps, get_validator as _get, loads_json as _loads
+    loads_json, dumps_json_bytes, get_validator = _loads, _dumps, _get
 
 
 @dataclass
@@ -44,15 +71,27 @@ class CaseResult:
     error: Optional[str] = None
     trace: Optional[str] = None
     validated: bool = False
+    # (live exception, traceback limit); not a field, so it stays out of the report.
+    # Formatted into `trace` only when the report is built.
+    exc = None  # type: Optional[Tuple[BaseException, int]]
+
+    def format_trace(self, enabled: bool = True) -> None:
+        if self.exc is not None and enabled:
+            e, limit = self.exc
+            self.trace = "".join(traceback.format_exception(type(e), e, e.__traceback__, limit=limit))
+        self.exc = None
+
+
+# CaseResult is flat, so report rows are a plain getattr over its fields (no asdict deep copy)
+_FIELDS = tuple(f.name for f in fields(CaseResult))
 
 
 def _read_json(path: Path) -> Dict[str, Any]:
-    return json.loads(path.read_text(encoding="utf-8"))
+    return loads_json(path.read_bytes())
 
 
 def _write_json(path: Path, obj: Any) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    path.write_bytes(dumps_json_bytes(obj, indent=True))
 
 
 def _load_schema(schema_path: Path) -> Dict[str, Any]:
@@ -61,13 +100,68 @@ def _load_schema(schema_path: Path) -> Dict[str, Any]:
     return _read_json(schema_path)
 
 
-def _get_validator(schema: Dict[str, Any]) -> jsonschema.Validator:
+def _use_jsonschema() -> bool:
+    return (os.getenv("USE_JSONSCHEMA") or "").strip().lower() in {"1", "true", "yes"}
+
+
+@lru_cache(maxsize=8)
+def _jsonschema_validator(schema_json: str, check_schema: bool) -> Callable[[Any], Any]:
+    # one Validator instance (and at most one meta-schema check) per schema per process
+    schema = json.loads(schema_json)
     ValidatorCls = jsonschema.validators.validator_for(schema)
-    ValidatorCls.check_schema(schema)
-    return ValidatorCls(schema)
+    if check_schema:
+        ValidatorCls.check_schema(schema)
+    return ValidatorCls(schema).validate
+
+
+def _get_validator(schema: Dict[str, Any], check_schema: bool = True) -> Callable[[Any], Any]:
+    if fastjsonschema is not None and not _use_jsonschema():
+        return get_validator(schema)
+    return _jsonschema_validator(json.dumps(schema, sort_keys=True), check_schema)
+
+
+# Supported generator calling conventions, in priority order: (positional, keyword) arg names.
+_GENERATOR_CALLS: list[Tuple[Tuple[str, ...], Tuple[str, ...]]] = [
+    # Most likely for your project:
+    (("intake", "output_schema", "risk_level", "risk_flags"), ()),
+    (("intake", "output_schema"), ("risk_level", "risk_flags")),
+    # Fallbacks (just in case signature differs in some branches):
+    (("intake", "output_schema"), ()),
+    (("intake", "risk_level", "risk_flags"), ()),
+    (("intake",), ("risk_level", "risk_flags")),
+    (("intake",), ()),
+]
+
+def _bind_generator(fn: Callable[..., Any]) -> Callable[[Dict[str, Any], Dict[str, Any], str, list], Any]:
+    """
+    Picks the first calling convention the generator's signature accepts (checked
+    with Signature.bind, so the generator itself is never called to probe) and
+    returns a wrapper taking (intake, output_schema, risk_level, risk_flags).
+    """
+    try:
+        sig = inspect.signature(fn)
+    except (TypeError, ValueError):
+        # no introspectable signature (some C callables): assume the full convention
+        return fn
+
+    for pos, kw in _GENERATOR_CALLS:
+        try:
+            sig.bind(*pos, **{k: k for k in kw})
+        except TypeError:
+            continue
+        if not kw and len(pos) == 4:
+            return fn
+
+        def call(intake, output_schema, risk_level, risk_flags, _pos=pos, _kw=kw):
+            values = {"intake": intake, "output_schema": output_schema,
+                      "risk_level": risk_level, "risk_flags": risk_flags}
+            return fn(*(values[n] for n in _pos), **{k: values[k] for k in _kw})
 
+        return call
 
-def _try_import_generator() -> Callable[[Dict[str, Any]], Any]:
+    raise RuntimeError(f"Unsupported generator signature: {getattr(fn, '__name__', fn)}{sig}")
+
+def _try_import_generator() -> Callable[[Dict[str, Any], Dict[str, Any], str, list], Any]:
     """
     Tries to import your project's generator.
     Expected locations (in order):
@@ -88,7 +182,7 @@ def _try_import_generator() -> Callable[[Dict[str, Any]], Any]:
             mod = importlib.import_module(mod_name)
             fn = getattr(mod, fn_name, None)
             if callable(fn):
-                return fn  # type: ignore[return-value]
+                return _bind_generator(fn)
         except Exception as e:
             last_err = e
 
@@ -101,91 +195,70 @@ def _try_import_generator() -> Callable[[Dict[str, Any]], Any]:
         msg += f"Last import error: {last_err}"
     raise RuntimeError(msg)
 
+# Debug files the generator writes (into DEBUG_ARTIFACTS_DIR, default CWD)
+_ARTIFACT_NAMES = ("last_model_raw.txt", "last_model_prompt.txt")
+
+def _artifact_dir() -> Path:
+    return Path(os.getenv("DEBUG_ARTIFACTS_DIR", "").strip() or ".")
+
+def _clear_artifacts() -> None:
+    # so a case never picks up the files an earlier case left behind
+    for name in _ARTIFACT_NAMES:
+        try:
+            (_artifact_dir() / name).unlink()
+        except OSError:
+            pass
+
+def _capture_artifact(src_name: str, raw_dir: Path, dst_name: str) -> Optional[str]:
+    # EAFP: a missing source is the common case, so skip the separate exists() stat
+    dst = raw_dir / dst_name
+    try:
+        shutil.copyfile(_artifact_dir() / src_name, dst)
+        return str(dst.as_posix())
+    except Exception:
+        return None
+
 def _capture_raw_artifact(raw_dir: Path, case_stem: str) -> Optional[str]:
     """
     If your generator writes last_model_raw.txt (per earlier troubleshooting),
     we copy it into raw_dir with a per-case name.
     """
-    src = Path("last_model_raw.txt")
-    if not src.exists():
-        return None
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    dst = raw_dir / f"raw_{case_stem}.txt"
-    try:
-        dst.write_text(src.read_text(encoding="utf-8", errors="ignore"), encoding="utf-8")
-        return str(dst.as_posix())
-    except Exception:
-        return None
+    return _capture_artifact("last_model_raw.txt", raw_dir, f"raw_{case_stem}.txt")
 
 def _capture_prompt_artifact(raw_dir: Path, case_stem: str) -> Optional[str]:
     """
     Copies last_model_prompt.txt (written by generator.py when SAVE_LAST_PROMPT=1)
     into raw_dir with a per-case name.
     """
-    src = Path("last_model_prompt.txt")
-    if not src.exists():
-        return None
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    dst = raw_dir / f"prompt_{case_stem}.txt"
-    try:
-        dst.write_text(src.read_text(encoding="utf-8", errors="ignore"), encoding="utf-8")
-        return str(dst.as_posix())
-    except Exception:
-        return None
+    return _capture_artifact("last_model_prompt.txt", raw_dir, f"prompt_{case_stem}.txt")
 
 def _call_generator(generate_fn, intake: Dict[str, Any], output_schema: Dict[str, Any]) -> Any:
     """
-    Calls generator with a compatible signature.
-
-    Priority:
-      1) (intake, output_schema, risk_level, risk_flags)
-      2) (intake, output_schema, risk_level=..., risk_flags=...)
-      3) shorter fallbacks (if project changes later)
+    Calls the generator bound by _try_import_generator with the intake's rule-based risk.
     """
     risk = intake.get("risk_flags_rule_based") or {}
     risk_level = risk.get("risk_level") or "LOW"
     risk_flags = risk.get("flags") or []
-
-    attempts = [
-        # Most likely for your project:
-        lambda: generate_fn(intake, output_schema, risk_level, risk_flags),
-        lambda: generate_fn(intake, output_schema, risk_level=risk_level, risk_flags=risk_flags),
-
-        # Fallbacks (just in case signature differs in some branches):
-        lambda: generate_fn(intake, output_schema),
-        lambda: generate_fn(intake, risk_level, risk_flags),
-        lambda: generate_fn(intake, risk_level=risk_level, risk_flags=risk_flags),
-        lambda: generate_fn(intake),
-    ]
-
-    last_err: Exception | None = None
-    for attempt in attempts:
-        try:
-            return attempt()
-        except TypeError as e:
-            last_err = e
-
-    # If we got here, none of the signatures matched
-    raise last_err if last_err else RuntimeError("Generator call failed for unknown reasons.")
+    return generate_fn(intake, output_schema, risk_level, risk_flags)
 
 def run_one_case(
     case_path: Path,
     out_dir: Path,
     raw_dir: Path,
-    validator: jsonschema.Validator,
-    generate_fn: Callable[[Dict[str, Any]], Any],
-    output_schema: Dict[str, Any],
+    validator: Callable[[Any], Any],
+    call_generator: Callable[[Dict[str, Any]], Any],
 ) -> CaseResult:
     case_stem = case_path.stem
     result = CaseResult(case_file=str(case_path.as_posix()), ok=False)
 
+    _clear_artifacts()
     try:
         intake = _read_json(case_path)
 
         # If missing attachments cause trouble in your pipeline, uncomment this:
         # intake["attachments"] = []
 
-        output = _call_generator(generate_fn, intake, output_schema)
+        output = call_generator(intake)
 
         # Some implementations may return (output, raw_text) or {"output":..., "raw":...}
         raw_text: Optional[str] = None
@@ -199,7 +272,7 @@ def run_one_case(
             raise TypeError(f"Generator returned non-dict output: {type(output)}")
 
         # Validate against schema
-        validator.validate(output)
+        validator(output)
         result.validated = True
 
         # Save output_*.json
@@ -209,31 +282,72 @@ def run_one_case(
 
         # Save/copy RAW if we have it
         if raw_text:
-            raw_dir.mkdir(parents=True, exist_ok=True)
             raw_path = raw_dir / f"raw_{case_stem}.txt"
             raw_path.write_text(raw_text, encoding="utf-8", errors="ignore")
             result.raw_file = str(raw_path.as_posix())
-        else:
-            # fallback: copy last_model_raw.txt if exists
-            result.raw_file = _capture_raw_artifact(raw_dir, case_stem)            
-        
+
         result.ok = True
-        result.prompt_file = _capture_prompt_artifact(raw_dir, case_stem)
-        return result
 
-    except ValidationError as e:
+    except (ValidationError, JsonSchemaException) as e:
         result.error = f"Schema validation failed: {e.message}"
-        result.trace = traceback.format_exc(limit=3)
-        result.raw_file = _capture_raw_artifact(raw_dir, case_stem)
-        result.prompt_file = _capture_prompt_artifact(raw_dir, case_stem)
-        return result
+        result.exc = (e, 3)
 
     except Exception as e:
         result.error = f"{type(e).__name__}: {e}"
-        result.trace = traceback.format_exc(limit=5)
-        result.raw_file = _capture_raw_artifact(raw_dir, case_stem)
+        result.exc = (e, 5)
+
+    finally:
+        # one capture pass per case; fallback for RAW: copy last_model_raw.txt if exists
+        result.raw_file = result.raw_file or _capture_raw_artifact(raw_dir, case_stem)
         result.prompt_file = _capture_prompt_artifact(raw_dir, case_stem)
-        return result
+
+    return result
+
+# Per-process case runner state, set by _init_worker (in the parent for serial runs,
+# in each pool process otherwise).
+_WORKER: Optional[Tuple[Path, Path, Callable[[Any], Any], Callable[[Dict[str, Any]], Any]]] = None
+_WITH_TRACE = True
+
+def _init_worker(
+    schema_path: str,
+    out_dir: str,
+    raw_dir: str,
+    check_schema: bool = True,
+    with_trace: bool = True,
+) -> None:
+    global _WORKER, _WITH_TRACE
+    _load_deps()
+    _WITH_TRACE = with_trace
+    schema = _load_schema(Path(schema_path))
+    validator = _get_validator(schema, check_schema=check_schema)
+    # generator and schema are fixed for the run: bind them once, per case only the intake varies
+    call_generator = partial(_call_generator, _try_import_generator(), output_schema=schema)
+    _WORKER = (Path(out_dir), Path(raw_dir), validator, call_generator)
+
+def _init_pool_worker(scratch_root: str, *initargs: Any) -> None:
+    # Each pool process gets its own DEBUG_ARTIFACTS_DIR, so the generator's last_model_*.txt
+    # files (and the captures copied from them) can't mix cases from different workers.
+    scratch = Path(scratch_root) / str(os.getpid())
+    scratch.mkdir()
+    os.environ["DEBUG_ARTIFACTS_DIR"] = str(scratch)
+    _init_worker(*initargs)
+
+def _run_case_worker(case_path: str) -> CaseResult:
+    out_dir, raw_dir, validator, call_generator = _WORKER  # type: ignore[misc]
+    return run_one_case(Path(case_path), out_dir, raw_dir, validator, call_generator)
+
+def _run_case_pooled(case_path: str) -> CaseResult:
+    # tracebacks don't pickle, so pool workers format (or drop) them before returning
+    r = _run_case_worker(case_path)
+    r.format_trace(_WITH_TRACE)
+    return r
+
+# Env settings checked at startup and recorded in the report's run_config.
+_REPORT_ENV_KEYS = ("MODEL_PROVIDER", "MODEL_ID", "MAX_NEW_TOKENS", "RETRIES", "SAVE_LAST_PROMPT")
+
+# Markdown report table row; errors get '|' escaped so they stay in their cell.
+_ROW = "| `{name}` | **{status}** | {out} | {raw} | {err} |".format
+_PIPE_TBL = str.maketrans({"|": "&#124;"})
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Run demo cases end-to-end and validate outputs.")
@@ -243,10 +357,37 @@ def main() -> int:
     parser.add_argument("--schema", default="schemas/output.schema.json", help="Output JSON schema path")
     parser.add_argument("--report", default="data_demo/demo_report.json", help="Machine-readable report path")
     parser.add_argument("--report_md", default="data_demo/demo_report.md", help="Human-readable report path")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Run cases in N processes (each loads its own model and writes its "
+        "last_model_*.txt debug files to a private scratch dir)",
+    )
+    parser.add_argument(
+        "--skip-schema-check",
+        action="store_true",
+        help="Skip the meta-schema check of --schema (jsonschema backend only; for warm runs)",
+    )
+    parser.add_argument("--no-trace", action="store_true", help="Leave failure tracebacks out of the report")
     args = parser.parse_args()
+
+    # Optional .env support (doesn't fail if not installed); before the env checks below
+    try:
+        from dotenv import load_dotenv  # type: ignore
+        load_dotenv()
+    except Exception:
+        pass
+
+    # for demo runs: ensure prompt capture is on unless explicitly disabled
+    os.environ.setdefault("SAVE_LAST_PROMPT", "1")
+
+    # read once: used by the checks below and recorded as-is in the report
+    env_snapshot = {k: os.environ.get(k, "").strip() for k in _REPORT_ENV_KEYS}
+
     # --- fail-fast: basic env sanity (no tokens) ---
-    provider = (os.getenv("MODEL_PROVIDER") or "").strip()
-    model_id = (os.getenv("MODEL_ID") or "").strip()
+    provider = env_snapshot["MODEL_PROVIDER"]
+    model_id = env_snapshot["MODEL_ID"]
 
     if not provider:
         print("ERROR: MODEL_PROVIDER is empty. Set it in .env (e.g. MODEL_PROVIDER=transformers).", file=sys.stderr)
@@ -255,56 +396,83 @@ def main() -> int:
     if provider == "transformers" and not model_id:
         print("ERROR: MODEL_ID is empty for MODEL_PROVIDER=transformers. Set MODEL_ID in .env.", file=sys.stderr)
         return 2
-
-    # for demo runs: ensure prompt capture is on unless explicitly disabled
-    os.environ.setdefault("SAVE_LAST_PROMPT", "1")
     # ----------------------------------------------
     cases_dir = Path(args.cases_dir)
     out_dir = Path(args.out_dir)
     raw_dir = Path(args.raw_dir)
     schema_path = Path(args.schema)
+    report_path = Path(args.report)
+    report_md_path = Path(args.report_md)
 
     if not cases_dir.exists():
         print(f"ERROR: cases_dir not found: {cases_dir}", file=sys.stderr)
         return 2
 
-    schema = _load_schema(schema_path)
-    validator = _get_validator(schema)
-    generate_fn = _try_import_generator()
+    # in-process init fails fast on schema/generator errors
+    initargs = (str(schema_path), str(out_dir), str(raw_dir), not args.skip_schema_check, not args.no_trace)
+    _init_worker(*initargs)
 
-    case_files = sorted(cases_dir.glob("*.json"))
+    # name filter first: DirEntry.is_file() is only consulted (cached stat) for *.json entries
+    with os.scandir(cases_dir) as it:
+        case_files = sorted(
+            (Path(e.path) for e in it if e.name.endswith(".json") and e.is_file()),
+            key=lambda p: p.name,
+        )
     if not case_files:
         print(f"ERROR: no cases found in {cases_dir}", file=sys.stderr)
         return 2
 
+    # output dirs are created once here; _write_json and the capture helpers assume they exist
+    for d in {out_dir, raw_dir, report_path.parent, report_md_path.parent}:
+        d.mkdir(parents=True, exist_ok=True)
+
     started = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
     results: list[CaseResult] = []
     ok_count = 0
 
+    workers = max(1, min(args.workers, len(case_files)))
+    case_args = [str(p) for p in case_files]
+    pool: Optional[ProcessPoolExecutor] = None
+    scratch: Optional[tempfile.TemporaryDirectory] = None
+    if workers > 1:
+        scratch = tempfile.TemporaryDirectory(prefix="run_demo_")
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_pool_worker, initargs=(scratch.name, *initargs)
+        )
+        case_results = pool.map(_run_case_pooled, case_args)
+    else:
+        case_results = map(_run_case_worker, case_args)
+
     print(f"Running {len(case_files)} demo case(s)...")
-    for p in case_files:
-        r = run_one_case(p, out_dir, raw_dir, validator, generate_fn, schema)
-        results.append(r)
-        status = "OK" if r.ok else "FAILED"
-        print(f"- {status}: {p.name}")
-        if not r.ok:
-            print(f"  reason: {r.error}")
-            if r.raw_file:
-                print(f"  raw:    {r.raw_file}")
-
-        ok_count += 1 if r.ok else 0
+    try:
+        for p, r in zip(case_files, case_results):
+            results.append(r)
+            status = "OK" if r.ok else "FAILED"
+            print(f"- {status}: {p.name}")
+            if not r.ok:
+                print(f"  reason: {r.error}")
+                if r.raw_file:
+                    print(f"  raw:    {r.raw_file}")
+
+            ok_count += 1 if r.ok else 0
+            if args.no_trace:
+                r.format_trace(False)  # drop the exception (and its frames) right away
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if scratch is not None:
+            scratch.cleanup()
 
     finished = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
+    for r in results:
+        r.format_trace(not args.no_trace)
+
     run_config = {
-        "MODEL_PROVIDER": (os.getenv("MODEL_PROVIDER") or "").strip(),
-        "MODEL_ID": (os.getenv("MODEL_ID") or "").strip(),
-        "MAX_NEW_TOKENS": (os.getenv("MAX_NEW_TOKENS") or "").strip(),
-        "RETRIES": (os.getenv("RETRIES") or "").strip(),
-        "SAVE_LAST_PROMPT": (os.getenv("SAVE_LAST_PROMPT") or "").strip(),
+        **env_snapshot,
         "schema_path": str(schema_path.as_posix()),
-}
+    }
     report_obj = {
         "started_at": started,
         "finished_at": finished,
@@ -312,14 +480,13 @@ def main() -> int:
         "cases_total": len(case_files),
         "cases_ok": ok_count,
         "cases_failed": len(case_files) - ok_count,
-        "results": [asdict(r) for r in results],
+        "results": [{k: getattr(r, k) for k in _FIELDS} for r in results],
     }
 
-    report_path = Path(args.report)
     _write_json(report_path, report_obj)
 
     # Markdown report (nice for README / CI logs)
-    md_lines = [
+    md_header = (
         "# Demo run report",
         "",
         f"- started_at: `{started}`",
@@ -330,19 +497,21 @@ def main() -> int:
         "",
         "| case | status | output | raw | error |",
         "|---|---:|---|---|---|",
-    ]
-    for r in results:
-        status = "OK" if r.ok else "FAILED"
-        md_lines.append(
-            f"| `{Path(r.case_file).name}` | **{status}** | "
-            f"{('`'+r.output_file+'`') if r.output_file else ''} | "
-            f"{('`'+r.raw_file+'`') if r.raw_file else ''} | "
-            f"{(r.error or '').replace('|','&#124;')} |"
+    )
+    md_rows = (
+        _ROW(
+            name=Path(r.case_file).name,
+            status="OK" if r.ok else "FAILED",
+            out=f"`{r.output_file}`" if r.output_file else "",
+            raw=f"`{r.raw_file}`" if r.raw_file else "",
+            err=r.error.translate(_PIPE_TBL) if r.error else "",
         )
+        for r in results
+    )
 
-    report_md_path = Path(args.report_md)
-    report_md_path.parent.mkdir(parents=True, exist_ok=True)
-    report_md_path.write_text("\n".join(md_lines) + "\n", encoding="utf-8")
+    # binary mode: one encode per line and one buffered write, no TextIOWrapper
+    with report_md_path.open("wb") as f:
+        f.writelines(line.encode("utf-8") + b"\n" for line in chain(md_header, md_rows))
 
     print("")
     print(f"Report: {report_path.as_posix()}")
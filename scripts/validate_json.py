@@ -1,22 +1,44 @@
+import os
+import sys
 import json
 from pathlib import Path
-from jsonschema import validate
 
 BASE = Path(__file__).resolve().parents[1]
-intake_schema = json.loads((BASE / "schemas" / "intake.schema.json").read_text(encoding="utf-8"))
-output_schema = json.loads((BASE / "schemas" / "output.schema.json").read_text(encoding="utf-8"))
+if str(BASE) not in sys.path:
+    sys.path.insert(0, str(BASE))
+
+def read_json(path):
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+def get_validator(name):
+    schema = read_json(BASE / "schemas" / f"{name}.schema.json")
+    # USE_JSONSCHEMA=1 forces the reference jsonschema path
+    if os.getenv("USE_JSONSCHEMA", "").strip().lower() in {"1", "true", "yes"}:
+        from jsonschema import validate
+        return lambda data: validate(instance=data, schema=schema)
+    # compiled fastjsonschema validator (jsonschema fallback), shared with the app
+    from app.core.json_utils import get_validator as compiled_validator
+    return compiled_validator(schema)
 
 def main():
     import argparse
     p = argparse.ArgumentParser()
     p.add_argument("--schema", choices=["intake","output"], required=True)
-    p.add_argument("--file", required=True)
+    p.add_argument("--file", required=True, nargs="+", help="One or more JSON files to validate")
     args = p.parse_args()
 
-    data = json.loads(Path(args.file).read_text(encoding="utf-8"))
-    schema = intake_schema if args.schema == "intake" else output_schema
-    validate(instance=data, schema=schema)
-    print("OK")
+    # only the selected schema is touched, and only once the CLI args are known good
+    validate = get_validator(args.schema)
+    failed = 0
+    for fp in args.file:
+        try:
+            validate(read_json(fp))
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {fp}: {getattr(e, 'message', e)}", file=sys.stderr)
+        else:
+            print(f"OK {fp}")
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())